@@ -9,106 +9,243 @@ summaries + decisions.
 
 from __future__ import annotations
 
+import argparse
+import concurrent.futures
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import os
 import pathlib
 import re
+import types
 
+try:  # Same optional accelerator as fetch_crate_docs.py.
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
-def load_text(path: pathlib.Path) -> str:
-    return path.read_text(encoding="utf-8", errors="replace")
 
+# READMEs are scanned as bytes; only the matched bullets are decoded.
+_FEATURES_HDR = re.compile(rb"^#{1,4}\s+Features\s*$", re.IGNORECASE | re.MULTILINE)
+_NEXT_HDR = re.compile(rb"^#{1,4}\s+\S", re.MULTILINE)
+_BULLET = re.compile(rb"^[ \t]*[-*][-* \t]*(.*?)[ \t\r]*$", re.MULTILINE)
+# Features sections are short; bounding the scan keeps the cost predictable.
+FEATURES_SCAN_LIMIT = 4096
+MAX_FEATURES = 12
 
-def extract_features(readme: str) -> list[str]:
+# crate id -> (intended role, planned gate, adoption status); built once at import.
+_MAPPING = {
+    # Blue smoke core
+    "dlx-rs": ("Latin exact-cover solver (DLX / Algorithm X)", "solver-dlx", "planned"),
+    "bitvec": ("Bit-level candidate domains / masks", "core-bitvec", "planned"),
+    "mimalloc": ("High-performance global allocator (non-iOS)", "alloc-mimalloc", "planned"),
+    "bumpalo": ("Arena allocator for search nodes", "alloc-bumpalo", "planned"),
+    "smallvec": ("Small, stack-backed vectors (cage cell lists)", "core-smallvec", "now"),
+    "wide": ("SIMD vector types for hotpath checks", "simd-wide", "planned"),
+    "soa_derive": ("Struct-of-Arrays layout for batch throughput", "layout-soa", "planned"),
+    "likely_stable": ("Branch prediction hints", "perf-likely", "planned"),
+    "static_assertions": ("Compile-time size/alignment contracts", "perf-assertions", "planned"),
+    # Hyper-scale
+    "rayon": ("Parallel generation / batch solving", "parallel-rayon", "planned"),
+    "parking_lot": ("Fast locks for caches", "sync-parking_lot", "planned"),
+    "ringbuf": ("Lock-free SPSC telemetry queue", "telemetry-ringbuf", "planned"),
+    "dashmap": ("Concurrent caches/maps", "cache-dashmap", "planned"),
+    "nohash-hasher": ("Fast hash for integer keys", "hash-fast", "planned"),
+    "fxhash": ("Fast hash alternative", "hash-fast", "planned"),
+    "rand_pcg": ("Deterministic RNG streams (candidate)", "rng-pcg", "planned"),
+    "fixed": ("Deterministic fixed-point math", "math-fixed", "planned"),
+    "num-integer": ("GCD/LCM and integer utilities", "math-num-integer", "planned"),
+    # Zero-overhead architecture
+    "rkyv": ("Zero-copy snapshots / persistence", "io-rkyv", "planned"),
+    "crux_core": ("Headless UI architecture core", "ui-crux", "planned"),
+    "uniffi": ("Kotlin/Swift bindings generator", "ffi-uniffi", "planned"),
+    "rust-embed": ("Embed assets into binaries", "assets-embed", "planned"),
+    "bytemuck": ("Zero-cost byte casting where safe", "bytes-bytemuck", "planned"),
+    "anyhow": ("Ergonomic edge error handling", "errors-anyhow", "planned"),
+    "thiserror": ("Typed library errors", "errors-thiserror", "now"),
+    # Tooling / verification
+    "tracing": ("Structured spans/events", "telemetry-tracing", "now"),
+    "tracing-subscriber": ("Tracing output routing", "telemetry-subscriber", "planned"),
+    "tracing-tracy": ("Tracy profiler integration", "telemetry-tracy", "planned"),
+    "criterion": ("Statistical benchmarking", "bench-criterion", "planned"),
+    "ratatui": ("Developer TUI dashboard", "dev-tui", "planned"),
+    "varisat": ("SAT solver for uniqueness proofs", "sat-varisat", "planned"),
+    "z3": ("SMT solver for formal checks", "smt-z3", "planned"),
+    "kani": ("Model checking harnesses", "verify-kani", "planned"),
+    "proptest": ("Property-based tests", "fuzz", "planned"),
+    "bolero": ("Fuzz/property tests", "fuzz", "planned"),
+    "nom": ("Legacy corpus parsing", "io-nom", "planned"),
+}
+MAPPING = types.MappingProxyType(_MAPPING)
+UNMAPPED = ("TBD", "TBD", "planned")
+
+# Output files are small and independent; overlap their open/write/close latency.
+WRITE_WORKERS = 8
+# Folded into every input digest: any edit to this script (the templates included)
+# invalidates the whole manifest, so there is no version constant to forget to bump.
+_SCRIPT_DIGEST = hashlib.sha1(pathlib.Path(__file__).read_bytes()).hexdigest()
+
+
+def load_json(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+@functools.lru_cache(maxsize=256)
+def load_bytes(path: pathlib.Path) -> bytes:
+    # Reader for fetched artifacts. Everything stays bytes: JSON goes straight to the
+    # parser, READMEs to byte regexes. Memoized per process (bytes are immutable, so
+    # sharing is safe); call `load_bytes.cache_clear()` if artifacts change underneath
+    # a long-lived process.
+    data = path.read_bytes()
+    return gzip.decompress(data) if path.suffix == ".gz" else data
+
+
+def write_atomic(path: pathlib.Path, data: bytes) -> None:
+    # Readers never observe a half-written file: write beside it, then rename over it.
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_bytes(item: tuple[pathlib.Path, bytes]) -> None:
+    write_atomic(*item)
+
+
+def load_manifest(path: pathlib.Path) -> dict:
+    # A missing, truncated or malformed manifest just means "nothing is known fresh".
+    try:
+        manifest = load_json(path.read_bytes())
+    except (FileNotFoundError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def list_names(path: pathlib.Path) -> set[str]:
+    # One directory sweep instead of a stat() per candidate artifact.
+    try:
+        with os.scandir(path) as it:
+            return {e.name for e in it}
+    except FileNotFoundError:
+        return set()
+
+
+def digest(*parts: object) -> str:
+    # Inputs are plain str/list/tuple values, so repr() is a stable serialization.
+    return hashlib.sha1(repr((_SCRIPT_DIGEST,) + parts).encode("utf-8")).hexdigest()
+
+
+def up_to_date(entry: object, inputs: str, path: pathlib.Path) -> bool:
+    # Inputs unchanged *and* the file on disk is still exactly what we wrote: docs/deps
+    # is tracked in git, so checkouts or hand edits can change it behind the manifest.
+    if not isinstance(entry, dict) or entry.get("inputs") != inputs:
+        return False
+    try:
+        return hashlib.sha1(path.read_bytes()).hexdigest() == entry.get("output")
+    except FileNotFoundError:
+        return False
+
+
+def record(manifest: dict, path: pathlib.Path, inputs: str, content: bytes) -> None:
+    manifest[path.name] = {"inputs": inputs, "output": hashlib.sha1(content).hexdigest()}
+
+
+def artifact(present: set[str], *names: str) -> str | None:
+    # First of `names` fetched, preferring the gzip-compressed form; plain files come
+    # from fetches that predate compression.
+    for name in names:
+        for candidate in (name + ".gz", name):
+            if candidate in present:
+                return candidate
+    return None
+
+
+def extract_features(readme: bytes) -> list[str]:
     # Heuristic: find a "Features" section header and collect bullet lines until next header.
-    m = re.search(r"^#{1,4}\s+Features\s*$", readme, flags=re.IGNORECASE | re.MULTILINE)
+    m = _FEATURES_HDR.search(readme)
     if not m:
         return []
-    tail = readme[m.end() :]
+    tail = readme[m.end() : m.end() + FEATURES_SCAN_LIMIT]
+    if len(tail) == FEATURES_SCAN_LIMIT:
+        # Cut at the limit: drop the partial last line so no truncated bullet (or split
+        # UTF-8 sequence) is reported.
+        tail = tail[: tail.rfind(b"\n") + 1]
     # stop at next header
-    stop = re.search(r"^#{1,4}\s+\S", tail, flags=re.MULTILINE)
+    stop = _NEXT_HDR.search(tail)
     if stop:
         tail = tail[: stop.start()]
-    feats = []
-    for line in tail.splitlines():
-        line = line.strip()
-        if line.startswith(("-", "*")):
-            feats.append(line.lstrip("-* ").strip())
-        if len(feats) >= 12:
-            break
-    return feats
+    return [
+        b.group(1).decode("utf-8", errors="replace")
+        for b in itertools.islice(_BULLET.finditer(tail), MAX_FEATURES)
+    ]
 
 
-def extract_cargo_features(versions_json: str, max_version: str) -> list[str]:
+def extract_cargo_features(version_json: bytes, max_version: str) -> list[str]:
+    # Prefer the single-version payload ({"version": {...}}); older fetches stored the
+    # full release list ({"versions": [...]}), which we still scan for `max_version`.
     try:
-        obj = json.loads(versions_json)
-        for v in obj.get("versions", []):
-            if v.get("num") == max_version:
-                feats = v.get("features") or {}
-                return sorted(feats.keys())
+        obj = load_json(version_json)
+        v = obj.get("version")
+        if v is None:
+            v = next((v for v in obj.get("versions", []) if v.get("num") == max_version), None)
+        if v and v.get("num") == max_version:
+            feats = v.get("features") or {}
+            return sorted(feats.keys())
     except Exception:  # noqa: BLE001
         return []
     return []
 
 
-def main() -> int:
+def positive_int(text: str) -> int:
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--limit",
+        type=positive_int,
+        metavar="K",
+        help="only distill the first K crates by name (leaves README.md untouched)",
+    )
+    args = parser.parse_args(argv)
+
     root = pathlib.Path(__file__).resolve().parents[1]
     src_root = root / "third_party" / "crate_docs"
     out_root = root / "docs" / "deps"
     out_root.mkdir(parents=True, exist_ok=True)
 
     index_path = src_root / "index.json"
-    index = json.loads(load_text(index_path))
-
-    mapping = {
-        # Blue smoke core
-        "dlx-rs": ("Latin exact-cover solver (DLX / Algorithm X)", "solver-dlx", "planned"),
-        "bitvec": ("Bit-level candidate domains / masks", "core-bitvec", "planned"),
-        "mimalloc": ("High-performance global allocator (non-iOS)", "alloc-mimalloc", "planned"),
-        "bumpalo": ("Arena allocator for search nodes", "alloc-bumpalo", "planned"),
-        "smallvec": ("Small, stack-backed vectors (cage cell lists)", "core-smallvec", "now"),
-        "wide": ("SIMD vector types for hotpath checks", "simd-wide", "planned"),
-        "soa_derive": ("Struct-of-Arrays layout for batch throughput", "layout-soa", "planned"),
-        "likely_stable": ("Branch prediction hints", "perf-likely", "planned"),
-        "static_assertions": ("Compile-time size/alignment contracts", "perf-assertions", "planned"),
-        # Hyper-scale
-        "rayon": ("Parallel generation / batch solving", "parallel-rayon", "planned"),
-        "parking_lot": ("Fast locks for caches", "sync-parking_lot", "planned"),
-        "ringbuf": ("Lock-free SPSC telemetry queue", "telemetry-ringbuf", "planned"),
-        "dashmap": ("Concurrent caches/maps", "cache-dashmap", "planned"),
-        "nohash-hasher": ("Fast hash for integer keys", "hash-fast", "planned"),
-        "fxhash": ("Fast hash alternative", "hash-fast", "planned"),
-        "rand_pcg": ("Deterministic RNG streams (candidate)", "rng-pcg", "planned"),
-        "fixed": ("Deterministic fixed-point math", "math-fixed", "planned"),
-        "num-integer": ("GCD/LCM and integer utilities", "math-num-integer", "planned"),
-        # Zero-overhead architecture
-        "rkyv": ("Zero-copy snapshots / persistence", "io-rkyv", "planned"),
-        "crux_core": ("Headless UI architecture core", "ui-crux", "planned"),
-        "uniffi": ("Kotlin/Swift bindings generator", "ffi-uniffi", "planned"),
-        "rust-embed": ("Embed assets into binaries", "assets-embed", "planned"),
-        "bytemuck": ("Zero-cost byte casting where safe", "bytes-bytemuck", "planned"),
-        "anyhow": ("Ergonomic edge error handling", "errors-anyhow", "planned"),
-        "thiserror": ("Typed library errors", "errors-thiserror", "now"),
-        # Tooling / verification
-        "tracing": ("Structured spans/events", "telemetry-tracing", "now"),
-        "tracing-subscriber": ("Tracing output routing", "telemetry-subscriber", "planned"),
-        "tracing-tracy": ("Tracy profiler integration", "telemetry-tracy", "planned"),
-        "criterion": ("Statistical benchmarking", "bench-criterion", "planned"),
-        "ratatui": ("Developer TUI dashboard", "dev-tui", "planned"),
-        "varisat": ("SAT solver for uniqueness proofs", "sat-varisat", "planned"),
-        "z3": ("SMT solver for formal checks", "smt-z3", "planned"),
-        "kani": ("Model checking harnesses", "verify-kani", "planned"),
-        "proptest": ("Property-based tests", "fuzz", "planned"),
-        "bolero": ("Fuzz/property tests", "fuzz", "planned"),
-        "nom": ("Legacy corpus parsing", "io-nom", "planned"),
-    }
+    # index.json and the manifest are rewritten between runs, so they bypass the
+    # memoized artifact reader.
+    index = load_json(index_path.read_bytes())
+
+    # Output name -> {"inputs": digest of what it was rendered from, "output": digest of
+    # the bytes written}. Outputs whose inputs are unchanged and whose file still matches
+    # are not rebuilt or rewritten; delete the manifest to force a full regeneration.
+    manifest_path = src_root / ".distill_manifest.json"
+    manifest = load_manifest(manifest_path)
+    # A partial run keeps the digests of crates it did not visit.
+    new_manifest: dict[str, dict] = dict(manifest) if args.limit is not None else {}
 
     crate_rows = []
-    for crate, status in sorted(index.items()):
-        meta_path = src_root / crate / "meta.json"
-        readme_path = src_root / crate / "readme.md"
-        if not meta_path.exists():
+    pending: list[tuple[pathlib.Path, bytes]] = []
+    items = index.items()
+    # O(N log K) when only a prefix is wanted.
+    selected = sorted(items) if args.limit is None else heapq.nsmallest(args.limit, items)
+    for crate, status in selected:
+        crate_dir = src_root / crate
+        present = list_names(crate_dir)
+        meta_name = artifact(present, "meta.json")
+        if meta_name is None:
             continue
-        meta = json.loads(load_text(meta_path))
+        meta = load_json(load_bytes(crate_dir / meta_name))
         c = meta.get("crate", {})
         crate_id = c.get("id", crate)
         version = c.get("max_version", "")
@@ -116,60 +253,84 @@ def main() -> int:
         docs = c.get("documentation") or ""
         desc = (c.get("description") or "").strip()
 
-        readme = load_text(readme_path) if readme_path.exists() else ""
+        readme_name = artifact(present, "readme.md")
+        readme = load_bytes(crate_dir / readme_name) if readme_name else b""
         feats = extract_features(readme)
-        versions_path = src_root / crate / "versions.json"
+        version_name = artifact(present, "version.json", "versions.json")
         cargo_feats = (
-            extract_cargo_features(load_text(versions_path), version) if versions_path.exists() else []
+            extract_cargo_features(load_bytes(crate_dir / version_name), version)
+            if version_name
+            else []
         )
 
-        role, gate, st = mapping.get(crate_id, ("TBD", "TBD", "planned"))
+        role, gate, st = MAPPING.get(crate_id, UNMAPPED)
+
+        out_path = out_root / f"{crate_id}.md"
+        crate_rows.append((crate_id, desc))
+        inputs = digest(crate_id, desc, version, repo, docs, feats, cargo_feats, role, gate, st)
+        if up_to_date(manifest.get(out_path.name), inputs, out_path):
+            new_manifest[out_path.name] = manifest[out_path.name]
+            continue
 
-        out = []
-        out.append(f"# `{crate_id}` (audit)\n")
+        buf = io.StringIO()
+        w = buf.write
+        w(f"# `{crate_id}` (audit)\n")
         if desc:
-            out.append(desc + "\n")
-        out.append("## Upstream\n")
-        out.append(f"- crates.io: `https://crates.io/crates/{crate_id}`\n")
+            w(desc + "\n")
+        w("## Upstream\n")
+        w(f"- crates.io: `https://crates.io/crates/{crate_id}`\n")
         if version:
-            out.append(f"- latest observed: `{version}`\n")
+            w(f"- latest observed: `{version}`\n")
         if repo:
-            out.append(f"- repository: `{repo}`\n")
+            w(f"- repository: `{repo}`\n")
         if docs:
-            out.append(f"- documentation: `{docs}`\n")
-        out.append("\n## Why we care (engine mapping)\n")
-        out.append(f"- Intended role: {role}\n")
-        out.append(f"- Planned gate: `{gate}`\n")
-        out.append(f"- Adoption status: `{st}`\n")
-        out.append("\n## Notable features (from upstream docs, heuristic)\n")
+            w(f"- documentation: `{docs}`\n")
+        w("\n## Why we care (engine mapping)\n")
+        w(f"- Intended role: {role}\n")
+        w(f"- Planned gate: `{gate}`\n")
+        w(f"- Adoption status: `{st}`\n")
+        w("\n## Notable features (from upstream docs, heuristic)\n")
         if feats:
             for f in feats:
-                out.append(f"- {f}\n")
+                w(f"- {f}\n")
         else:
-            out.append("- (no Features section detected in README)\n")
+            w("- (no Features section detected in README)\n")
 
-        out.append("\n## Cargo features (from crates.io metadata)\n")
+        w("\n## Cargo features (from crates.io metadata)\n")
         if cargo_feats:
             for f in cargo_feats[:40]:
-                out.append(f"- `{f}`\n")
+                w(f"- `{f}`\n")
         else:
-            out.append("- (no feature metadata available)\n")
+            w("- (no feature metadata available)\n")
 
-        (out_root / f"{crate_id}.md").write_text("".join(out), encoding="utf-8")
-        crate_rows.append((crate_id, desc))
+        content = buf.getvalue().encode("utf-8")
+        record(new_manifest, out_path, inputs, content)
+        pending.append((out_path, content))
 
-    # Write an index for navigation.
-    idx = []
-    idx.append("# Dependency docs index\n\n")
-    idx.append("Generated from `third_party/crate_docs/`.\n\n")
-    for crate_id, desc in crate_rows:
-        line = f"- `docs/deps/{crate_id}.md`"
-        if desc:
-            line += f" — {desc}"
-        idx.append(line + "\n")
-    (out_root / "README.md").write_text("".join(idx), encoding="utf-8")
+    # Write an index for navigation (only a full run knows every row).
+    index_out = out_root / "README.md"
+    if args.limit is None:
+        inputs = digest(crate_rows)
+        if up_to_date(manifest.get(index_out.name), inputs, index_out):
+            new_manifest[index_out.name] = manifest[index_out.name]
+        else:
+            header = "# Dependency docs index\n\nGenerated from `third_party/crate_docs/`.\n\n"
+            body = "".join(
+                f"- `docs/deps/{crate_id}.md`" + (f" — {desc}" if desc else "") + "\n"
+                for crate_id, desc in crate_rows
+            )
+            content = (header + body).encode("utf-8")
+            record(new_manifest, index_out, inputs, content)
+            pending.append((index_out, content))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=WRITE_WORKERS) as ex:
+        # Drain the iterator so write errors propagate.
+        list(ex.map(write_bytes, pending))
+    # Only record digests once every write has landed.
+    write_atomic(manifest_path, json.dumps(new_manifest, indent=2, sort_keys=True).encode("utf-8") + b"\n")
 
-    print(f"Wrote {len(crate_rows)} summaries under {out_root}")
+    unchanged = len(crate_rows) + (args.limit is None) - len(pending)
+    print(f"Wrote {len(crate_rows)} summaries under {out_root} ({unchanged} files unchanged)")
     return 0
 
 
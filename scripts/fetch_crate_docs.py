@@ -2,18 +2,34 @@
 """
 Fetch crates.io metadata + README for our canonical dependency list.
 
-Writes raw artifacts to: third_party/crate_docs/<crate>/{meta.json,readme.md}
+Writes raw artifacts to: third_party/crate_docs/<crate>/{meta.json,version.json,readme.md}.gz
 (third_party is git-ignored; distilled summaries should live under docs/).
+Crate metadata is looked up BULK_SIZE crates per request via the list endpoint,
+falling back to the per-crate endpoint for anything the bulk response omits.
+Responses are cached under third_party/crate_docs/.cache/ keyed by URL: entries
+younger than CACHE_MAX_AGE are reused as-is, older ones are revalidated with
+If-None-Match against the stored ETag.
 """
 
 from __future__ import annotations
 
+import concurrent.futures
+import gzip
+import hashlib
+import http.client
 import json
 import os
 import pathlib
 import sys
+import threading
+import time
 import urllib.error
-import urllib.request
+import urllib.parse
+
+try:  # orjson parses/serializes ~2-5x faster; stdlib json keeps the script dependency-free.
+    import orjson
+except ImportError:  # pragma: no cover - optional accelerator
+    orjson = None
 
 
 CRATES = [
@@ -56,16 +72,246 @@ CRATES = [
 ]
 
 
-def http_get(url: str) -> bytes:
-    req = urllib.request.Request(
-        url,
-        headers={
-            "User-Agent": "rustykeen-crate-doc-audit/1.0",
-            "Accept": "*/*",
-        },
+# Requests are latency-bound, so overlap crates across a thread pool.
+MAX_WORKERS = 16
+MAX_REDIRECTS = 5
+# crates.io's list endpoint accepts `ids[]` filters; one request covers this many crates.
+BULK_SIZE = 10
+# Responses younger than this are served from .cache/ without touching the network.
+CACHE_MAX_AGE = 24 * 60 * 60
+
+HEADERS = {
+    "User-Agent": "rustykeen-crate-doc-audit/1.0",
+    "Accept": "*/*",
+}
+
+_local = threading.local()
+
+
+def load_json(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def dump_json(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode("utf-8")
+
+
+def write_index(path: pathlib.Path, entries) -> None:
+    # Stream `(crate, entry)` pairs as they complete instead of materializing the whole
+    # document; the layout matches a single indent=2 dump. That holds byte-for-byte only
+    # for ASCII content: orjson emits non-ASCII as raw UTF-8 where stdlib json writes
+    # \uXXXX escapes (every value here is an ASCII URL or status today). Written to a
+    # temp file and renamed so an interrupted run never leaves a truncated index.json.
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(b"{")
+        for i, (crate, entry) in enumerate(entries):
+            f.write(b",\n  " if i else b"\n  ")
+            f.write(dump_json(crate))
+            f.write(b": ")
+            f.write(dump_json(entry).replace(b"\n", b"\n  "))
+        f.write(b"\n}\n")
+    os.replace(tmp, path)
+
+
+def _connection(scheme: str, host: str) -> http.client.HTTPConnection:
+    # One persistent connection per (thread, host): keep-alive amortizes TCP/TLS setup
+    # across every request a worker issues.
+    conns = _local.__dict__.setdefault("conns", {})
+    conn = conns.get((scheme, host))
+    if conn is None:
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = cls(host, timeout=30)
+        conns[(scheme, host)] = conn
+    return conn
+
+
+def _send(url: str, headers: dict[str, str]) -> tuple[http.client.HTTPResponse, bytes]:
+    parts = urllib.parse.urlsplit(url)
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+    conn = _connection(parts.scheme, parts.netloc)
+    try:
+        conn.request("GET", target, headers=headers)
+        resp = conn.getresponse()
+    except (http.client.HTTPException, OSError):
+        # The server may have dropped an idle keep-alive socket; retry once on a fresh one.
+        conn.close()
+        conn.request("GET", target, headers=headers)
+        resp = conn.getresponse()
+    return resp, resp.read()
+
+
+def http_get(url: str, etag: str | None = None) -> tuple[bytes | None, str | None]:
+    """GET `url`, returning `(body, etag)`; `body` is None on 304 Not Modified."""
+    headers = dict(HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    for _ in range(MAX_REDIRECTS + 1):
+        resp, body = _send(url, headers)
+        location = resp.getheader("Location")
+        if resp.status in (301, 302, 303, 307, 308) and location:
+            url = urllib.parse.urljoin(url, location)
+            continue
+        if resp.status == 304:
+            return None, resp.getheader("ETag") or etag
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        return body, resp.getheader("ETag")
+    raise urllib.error.URLError(f"too many redirects: {url}")
+
+
+def write_atomic(path: pathlib.Path, data: bytes) -> None:
+    # Readers never observe a half-written file: write beside it, then rename over it.
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def cached_get(url: str, cache_dir: pathlib.Path, max_age: float = CACHE_MAX_AGE) -> tuple[bytes, str]:
+    """GET `url` through the on-disk cache, returning `(body, status)`.
+
+    `status` is "cached" when served without a request, "unchanged" after a 304
+    revalidation of a stale entry, and "ok" after a full download.
+    """
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    body_path = cache_dir / f"{key}.bin"
+    meta_path = cache_dir / f"{key}.meta"
+    meta: dict = {}
+    if body_path.exists() and meta_path.exists():
+        try:
+            meta = load_json(meta_path.read_bytes())
+        except ValueError:
+            # Damaged sidecar: treat as a miss so the refetch below rewrites it.
+            meta = {}
+        if meta and time.time() - meta.get("fetched_at", 0) < max_age:
+            return body_path.read_bytes(), "cached"
+
+    body, etag = http_get(url, meta.get("etag"))
+    if body is None:
+        body, status = body_path.read_bytes(), "unchanged"
+    else:
+        write_atomic(body_path, body)
+        status = "ok"
+    write_atomic(
+        meta_path,
+        json.dumps({"url": url, "etag": etag, "fetched_at": time.time()}).encode("utf-8") + b"\n",
     )
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return resp.read()
+    return body, status
+
+
+def store(path: pathlib.Path, body: bytes) -> None:
+    # Artifacts are stored gzip-compressed (`<name>.gz`); crates.io JSON compresses well.
+    # Always rewritten from `body` (cheap, and mtime=0 keeps the bytes stable) so a
+    # damaged or stale artifact is repaired even when the response came from cache.
+    write_atomic(path.with_name(path.name + ".gz"), gzip.compress(body, compresslevel=6, mtime=0))
+
+
+def fetch_to(url: str, path: pathlib.Path, cache_dir: pathlib.Path) -> tuple[bytes, str]:
+    body, status = cached_get(url, cache_dir)
+    store(path, body)
+    return body, status
+
+
+def canonical_name(crate: str) -> str:
+    # crates.io treats `-` and `_` (and case) as equivalent in crate names.
+    return crate.replace("_", "-").lower()
+
+
+def fetch_bulk_meta(
+    crates: list[str], cache_dir: pathlib.Path
+) -> dict[str, tuple[str, dict, str]]:
+    """Look up `crates` in one list request, keyed by canonical name.
+
+    Values are `(url, meta_obj, status)` with `meta_obj` shaped like the per-crate
+    endpoint (`{"crate": {...}}`). Crates missing from the response, or a failed
+    request, are simply absent so callers fall back to per-crate fetches.
+    """
+    query = [("ids[]", c) for c in crates] + [("per_page", str(len(crates)))]
+    url = "https://crates.io/api/v1/crates?" + urllib.parse.urlencode(query)
+    try:
+        body, status = cached_get(url, cache_dir)
+        found = load_json(body).get("crates", [])
+    except Exception:  # noqa: BLE001
+        return {}
+    wanted = {canonical_name(c) for c in crates}
+    out: dict[str, tuple[str, dict, str]] = {}
+    for c in found:
+        for name in (c.get("id"), c.get("name")):
+            if name and canonical_name(name) in wanted:
+                out[canonical_name(name)] = (url, {"crate": c}, status)
+    return out
+
+
+def fetch_status(url: str, path: pathlib.Path, cache_dir: pathlib.Path) -> str:
+    try:
+        _, status = fetch_to(url, path, cache_dir)
+        return status
+    except urllib.error.HTTPError as e:
+        return f"http_error:{e.code}"
+    except Exception as e:  # noqa: BLE001
+        return f"error:{type(e).__name__}"
+
+
+def fetch_one(
+    crate: str,
+    out_root: pathlib.Path,
+    cache_dir: pathlib.Path,
+    leaf_pool: concurrent.futures.Executor,
+    bulk: tuple[str, dict, str] | None = None,
+) -> tuple[str, dict[str, str]]:
+    # meta must land first (from `bulk` when the list endpoint had it); version and
+    # readme only depend on meta, so they are issued together on `leaf_pool`. Crates
+    # run concurrently on the outer pool.
+    crate_dir = out_root / crate
+    crate_dir.mkdir(parents=True, exist_ok=True)
+
+    meta_url = f"https://crates.io/api/v1/crates/{crate}"
+    readme_url = ""
+    # Single-version endpoint: just the features we need, not every historical release.
+    version_url = ""
+
+    entry: dict[str, str] = {"meta_url": meta_url, "readme_url": readme_url}
+    try:
+        if bulk is not None:
+            entry["meta_source"], meta_obj, entry["meta"] = bulk
+            store(crate_dir / "meta.json", dump_json(meta_obj))
+        else:
+            meta, entry["meta"] = fetch_to(meta_url, crate_dir / "meta.json", cache_dir)
+            meta_obj = load_json(meta)
+        crate_id = meta_obj.get("crate", {}).get("id") or crate
+        max_version = meta_obj.get("crate", {}).get("max_version")
+        if max_version:
+            readme_url = (
+                f"https://crates.io/api/v1/crates/{crate_id}/{max_version}/readme"
+            )
+            version_url = f"https://crates.io/api/v1/crates/{crate_id}/{max_version}"
+    except urllib.error.HTTPError as e:
+        entry["meta"] = f"http_error:{e.code}"
+    except Exception as e:  # noqa: BLE001
+        entry["meta"] = f"error:{type(e).__name__}"
+
+    version = (
+        leaf_pool.submit(fetch_status, version_url, crate_dir / "version.json", cache_dir)
+        if version_url
+        else None
+    )
+    readme = (
+        leaf_pool.submit(fetch_status, readme_url, crate_dir / "readme.md", cache_dir)
+        if readme_url
+        else None
+    )
+    entry["version"] = version.result() if version else "skipped:no_meta"
+    if readme:
+        entry["readme_url"] = readme_url
+        entry["readme"] = readme.result()
+    else:
+        entry["readme"] = "skipped:no_meta"
+
+    return crate, entry
 
 
 def main() -> int:
@@ -73,60 +319,22 @@ def main() -> int:
     out_root = root / "third_party" / "crate_docs"
     out_root.mkdir(parents=True, exist_ok=True)
 
-    results: dict[str, dict[str, str]] = {}
-
-    for crate in CRATES:
-        crate_dir = out_root / crate
-        crate_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir = out_root / ".cache"
+    cache_dir.mkdir(exist_ok=True)
 
-        meta_url = f"https://crates.io/api/v1/crates/{crate}"
-        readme_url = ""
-        versions_url = f"https://crates.io/api/v1/crates/{crate}/versions"
+    # Leaf requests never submit further work, so the two pools cannot deadlock.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as leaf_pool:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+            chunks = [CRATES[i : i + BULK_SIZE] for i in range(0, len(CRATES), BULK_SIZE)]
+            bulk: dict[str, tuple[str, dict, str]] = {}
+            for found in ex.map(lambda chunk: fetch_bulk_meta(chunk, cache_dir), chunks):
+                bulk.update(found)
 
-        entry: dict[str, str] = {"meta_url": meta_url, "readme_url": readme_url}
-        try:
-            meta = http_get(meta_url)
-            (crate_dir / "meta.json").write_bytes(meta)
-            entry["meta"] = "ok"
-
-            meta_obj = json.loads(meta.decode("utf-8"))
-            crate_id = meta_obj.get("crate", {}).get("id") or crate
-            max_version = meta_obj.get("crate", {}).get("max_version")
-            if max_version:
-                readme_url = (
-                    f"https://crates.io/api/v1/crates/{crate_id}/{max_version}/readme"
-                )
-                versions_url = f"https://crates.io/api/v1/crates/{crate_id}/versions"
-        except urllib.error.HTTPError as e:
-            entry["meta"] = f"http_error:{e.code}"
-        except Exception as e:  # noqa: BLE001
-            entry["meta"] = f"error:{type(e).__name__}"
-
-        try:
-            vers = http_get(versions_url)
-            (crate_dir / "versions.json").write_bytes(vers)
-            entry["versions"] = "ok"
-        except urllib.error.HTTPError as e:
-            entry["versions"] = f"http_error:{e.code}"
-        except Exception as e:  # noqa: BLE001
-            entry["versions"] = f"error:{type(e).__name__}"
-
-        try:
-            if not readme_url:
-                entry["readme"] = "skipped:no_meta"
-            else:
-                entry["readme_url"] = readme_url
-                readme = http_get(readme_url)
-                (crate_dir / "readme.md").write_bytes(readme)
-                entry["readme"] = "ok"
-        except urllib.error.HTTPError as e:
-            entry["readme"] = f"http_error:{e.code}"
-        except Exception as e:  # noqa: BLE001
-            entry["readme"] = f"error:{type(e).__name__}"
-
-        results[crate] = entry
-
-    (out_root / "index.json").write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+            entries = ex.map(
+                lambda c: fetch_one(c, out_root, cache_dir, leaf_pool, bulk.get(canonical_name(c))),
+                CRATES,
+            )
+            write_index(out_root / "index.json", entries)
     print(f"Wrote {len(CRATES)} crate doc bundles under {out_root}")
     return 0
 